@@ -1,3 +1,7 @@
+-- Trigram support for case-insensitive partial search (ilike '%q%')
+create extension if not exists pg_trgm;
+
+
 -- Chunk 1: Players
 
 create table if not exists players (
@@ -9,6 +13,14 @@ create table if not exists players (
 create unique index if not exists uq_players_display_name_ci
   on players (lower(display_name));
 
+-- speed up /players?q= search
+create index if not exists idx_players_display_name_trgm
+  on players using gin (display_name gin_trgm_ops);
+
+-- speed up /players (newest first)
+create index if not exists idx_players_created_at
+  on players (created_at desc) include (player_id, display_name, avatar_url);
+
 
 -- Chunk 2: Venues (where games happen)
 
@@ -25,6 +37,14 @@ create table if not exists venues (
 create unique index if not exists uq_venues_name_ci
   on venues (lower(venue_name));
 
+-- EN: speed up /venues?q= and /games?venue= search
+create index if not exists idx_venues_venue_name_trgm
+  on venues using gin (venue_name gin_trgm_ops);
+
+-- EN: speed up /venues (newest first)
+create index if not exists idx_venues_created_at
+  on venues (created_at desc) include (venue_id, venue_name, address, city, state);
+
 
 -- Chunk 3: Games (each tournament instance)
 
@@ -39,14 +59,19 @@ create table if not exists games (
   created_at timestamptz not null default now()
 );
 
--- EN: fast lookup for "recent games"
-create index if not exists idx_games_start_time
-  on games (start_time desc);
+-- EN: fast lookup for "recent games" (covering: /games needs no heap sort)
+create index if not exists idx_games_start_time_covering
+  on games (start_time desc) include (game_id, game_title, status, buy_in, venue_id);
 
 -- EN: fast lookup by venue
 create index if not exists idx_games_venue
   on games (venue_id);
   
+-- EN: only the documented statuses are allowed
+alter table games
+  add constraint chk_games_status
+  check (status in ('scheduled', 'active', 'completed'));
+
 -- Make (venue_id, start_time) a stable unique identifier for a game
 alter table games
   add constraint uq_games_venue_start_time unique (venue_id, start_time);
@@ -0,0 +1,171 @@
+# cache.py
+import logging
+import os
+import threading
+import time
+import orjson
+import redis.asyncio as redis
+from cachetools import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Short-lived results for read-mostly endpoints, keyed by (endpoint, *args).
+# 读多写少接口的短期结果缓存，key 为 (接口名, *参数)。
+LIST_CACHE = TTLCache(maxsize=1024, ttl=30)
+
+# Game details for the newest games, kept longer than LIST_CACHE entries and cleared
+# by writes. The TTL bounds staleness from other workers or a read racing a write.
+# 最新几场比赛的详情，保留时间长于 LIST_CACHE，写操作时清空。
+# TTL 限制了其他 worker 写入或读写竞争导致的过期数据存活时间。
+PINNED_GAMES_MAX = 20
+PINNED_GAMES_TTL = 120
+PINNED_GAMES: dict[int, tuple[float, dict]] = {}
+
+# cachetools caches are not thread-safe.
+# cachetools 的缓存本身不是线程安全的。
+_lock = threading.Lock()
+
+
+def cache_get(key: tuple):
+    """
+    EN: Return the cached value for key, or None on a miss.
+    CN: 返回 key 对应的缓存值，未命中则返回 None。
+    """
+    with _lock:
+        return LIST_CACHE.get(key)
+
+
+def cache_set(key: tuple, value) -> None:
+    """
+    EN: Store value under key until the TTL expires.
+    CN: 以 key 缓存 value，直到 TTL 过期。
+    """
+    with _lock:
+        LIST_CACHE[key] = value
+
+
+def get_pinned_game(game_id: int):
+    """
+    EN: Return a pinned game detail payload, or None.
+    CN: 返回已固定的比赛详情，没有则返回 None。
+    """
+    with _lock:
+        entry = PINNED_GAMES.get(game_id)
+        if entry is None:
+            return None
+        expires_at, payload = entry
+        if expires_at <= time.monotonic():
+            del PINNED_GAMES[game_id]
+            return None
+        return payload
+
+
+def pin_game(game_id: int, payload: dict) -> None:
+    """
+    EN: Pin a game detail payload for PINNED_GAMES_TTL, keeping only the newest (highest id) games.
+    CN: 固定比赛详情 PINNED_GAMES_TTL 秒，只保留最新（id 最大）的若干场。
+    """
+    with _lock:
+        PINNED_GAMES[game_id] = (time.monotonic() + PINNED_GAMES_TTL, payload)
+        if len(PINNED_GAMES) > PINNED_GAMES_MAX:
+            del PINNED_GAMES[min(PINNED_GAMES)]
+
+
+def invalidate() -> None:
+    """
+    EN: Drop every cached entry (called after any write).
+    CN: 清空所有缓存（任何写操作后调用）。
+    """
+    with _lock:
+        LIST_CACHE.clear()
+        PINNED_GAMES.clear()
+
+
+# Shared Redis cache for game detail/leaderboards, so every worker reuses one DB fill.
+# Bump API_VERSION whenever the cached payload shape changes: old keys are ignored.
+# 跨 worker 共享的 Redis 缓存（比赛详情/榜单），一次查库所有 worker 复用。
+# 缓存内容结构变化时递增 API_VERSION，旧 key 自然失效。
+API_VERSION = 2
+GAME_TTL_SECONDS = 300
+
+redis_client: redis.Redis | None = None
+
+
+async def open_redis() -> None:
+    """
+    EN: Connect to REDIS_URL if set; without it the shared cache is skipped.
+    CN: 若设置了 REDIS_URL 则连接；未设置时跳过共享缓存。
+    """
+    global redis_client
+    redis_url = os.getenv("REDIS_URL")
+    if redis_url and redis_client is None:
+        redis_client = redis.from_url(redis_url)
+
+
+async def close_redis() -> None:
+    """
+    EN: Close the Redis connection pool (called at app shutdown).
+    CN: 关闭 Redis 连接池（应用关闭时调用）。
+    """
+    global redis_client
+    if redis_client is not None:
+        await redis_client.aclose()
+        redis_client = None
+
+
+def shared_enabled() -> bool:
+    """
+    EN: True when Redis is configured; game payloads are then cached only there, so
+        invalidate_game() reaches every worker.
+    CN: 配置了 Redis 时返回 True；此时比赛数据只缓存在 Redis，invalidate_game() 对所有 worker 生效。
+    """
+    return redis_client is not None
+
+
+def game_key(game_id: int) -> str:
+    return f"game:{game_id}:v{API_VERSION}"
+
+
+def game_results_key(game_id: int) -> str:
+    return f"game:{game_id}:results:v{API_VERSION}"
+
+
+async def shared_get(key: str):
+    """
+    EN: Return the decoded value from Redis, or None on a miss / no Redis / Redis error.
+    CN: 从 Redis 读取并解码；未命中、未配置或出错时返回 None。
+    """
+    if redis_client is None:
+        return None
+    try:
+        hit = await redis_client.get(key)
+    except redis.RedisError as exc:
+        logger.warning("Redis get failed for %s: %s", key, exc)
+        return None
+    return orjson.loads(hit) if hit else None
+
+
+async def shared_set(key: str, value) -> None:
+    """
+    EN: Store value in Redis for GAME_TTL_SECONDS (errors are logged, not raised).
+    CN: 写入 Redis，保存 GAME_TTL_SECONDS 秒（出错只记录日志，不抛出）。
+    """
+    if redis_client is None:
+        return
+    try:
+        await redis_client.setex(key, GAME_TTL_SECONDS, orjson.dumps(value))
+    except redis.RedisError as exc:
+        logger.warning("Redis set failed for %s: %s", key, exc)
+
+
+async def invalidate_game(game_id: int) -> None:
+    """
+    EN: Drop a game's shared cache entries (called after its results change).
+    CN: 删除某场比赛的共享缓存（其结果变化后调用）。
+    """
+    if redis_client is None:
+        return
+    try:
+        await redis_client.delete(game_key(game_id), game_results_key(game_id))
+    except redis.RedisError as exc:
+        logger.warning("Redis delete failed for game %s: %s", game_id, exc)
@@ -1,38 +1,122 @@
 # main.py
 import os
 import math
+import orjson
+from contextlib import asynccontextmanager
 from decimal import Decimal
-from functools import lru_cache
-from fastapi import FastAPI, Query, HTTPException
+from fastapi import FastAPI, Query, HTTPException, Request
+from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import RedirectResponse
-from pydantic import BaseModel, field_validator
+from fastapi.responses import JSONResponse, RedirectResponse
+from pydantic import BaseModel, TypeAdapter, ValidationError, field_validator
 from datetime import datetime
 from typing import List
-from db import get_conn
+from psycopg.rows import dict_row
+import db
+import cache
+from cache import (
+    cache_get,
+    cache_set,
+    game_key,
+    game_results_key,
+    get_pinned_game,
+    invalidate,
+    invalidate_game,
+    pin_game,
+    shared_enabled,
+    shared_get,
+    shared_set,
+)
+from db import get_pool
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Open the shared connection pool once per worker process.
+    # 每个 worker 进程只打开一次共享连接池。
+    await db.open_pool()
+    await db.run_migrations()
+    await cache.open_redis()
+    try:
+        yield
+    finally:
+        await cache.close_redis()
+        await db.close_pool()
+
+
+class ORJSONResponse(JSONResponse):
+    """
+    EN: JSON response rendered by orjson. Routes without a response_model still go through
+        jsonable_encoder first, so the hot GET handlers return this class directly to skip it.
+    CN: 使用 orjson 渲染的 JSON 响应。没有 response_model 的路由仍会先经过 jsonable_encoder，
+        因此高频 GET 接口直接返回本类以跳过这一步。
+    """
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content)
 
 
 app = FastAPI(
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
     docs_url="/api-docs",
     swagger_ui_oauth2_redirect_url="/api-docs/oauth2-redirect",
 )
 
 frontend_origins_env = os.getenv("FRONTEND_ORIGINS", "")
-frontend_origins = [
+# frozenset: duplicates collapse and Starlette's per-request `origin in ...` is O(1).
+# frozenset：去重，并让 Starlette 每次请求的 `origin in ...` 判断为 O(1)。
+frontend_origins = frozenset(
     origin.strip()
     for origin in frontend_origins_env.split(",")
     if origin.strip()
-]
+)
 if not frontend_origins:
-    frontend_origins = [
-        "http://localhost:3000",
-        "http://127.0.0.1:3000",
-    ]
+    frontend_origins = frozenset(
+        {
+            "http://localhost:3000",
+            "http://127.0.0.1:3000",
+        }
+    )
+
+
+# Pre-rendered bodies for the constant endpoints hit by load-balancer probes.
+# 负载均衡探测频繁访问的常量接口，响应体预先渲染好。
+_HEALTH = ORJSONResponse({"status": "ok"})
+_ROOT = ORJSONResponse({"message": "Poker backend is running"})
+
+
+class FastPathMiddleware:
+    """
+    EN: Answer GET / and GET /health before routing and dependency injection.
+    CN: 在路由和依赖注入之前直接响应 GET / 与 GET /health。
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["method"] == "GET":
+            path = scope["path"]
+            if path == "/health":
+                return await _HEALTH(scope, receive, send)
+            if path == "/":
+                return await _ROOT(scope, receive, send)
+        return await self.app(scope, receive, send)
+
+
+# Added before CORSMiddleware so it runs inside it: the short-circuited responses
+# still get CORS headers for browser callers.
+# 在 CORSMiddleware 之前添加，使其位于 CORS 内层：短路返回的响应仍带有 CORS 头。
+app.add_middleware(FastPathMiddleware)
 
 app.add_middleware(
     CORSMiddleware,
     allow_origins=frontend_origins,
-    allow_origin_regex=r"https://.*\.vercel\.app",
+    # Compiled once by Starlette and matched with fullmatch; [^/]* keeps the
+    # subdomain from spanning path-like text.
+    # 由 Starlette 编译一次并用 fullmatch 匹配；[^/]* 限定子域名不能跨越 "/"。
+    allow_origin_regex=r"https://[^/]*\.vercel\.app",
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
@@ -58,6 +142,10 @@ class ResultCreate(BaseModel):
     kos: int
     eliminated_by_player_id: int | None = None
 
+# Validates a whole POST /games/{game_id}/results body in one pydantic-core call.
+# 一次 pydantic-core 调用校验整个 POST /games/{game_id}/results 请求体。
+RESULTS_ADAPTER = TypeAdapter(List[ResultCreate])
+
 class PlayerCreate(BaseModel):
     display_name: str
     avatar_url: str | None = None
@@ -69,23 +157,33 @@ class VenueCreate(BaseModel):
     city: str = "Atlanta"
     state: str = "GA"
 
+# Still routed so they show up in /api-docs; FastPathMiddleware answers GETs first.
+# 仍保留路由以便出现在 /api-docs 中；GET 请求由 FastPathMiddleware 先行响应。
 @app.get("/")
-def root():
+async def root():
     return {"message": "Poker backend is running"}
 
 
 @app.get("/health")
-def health():
+async def health():
     return {"status": "ok"}
 
 
 @app.get("/docs", include_in_schema=False)
-def docs_redirect():
+async def docs_redirect():
     return RedirectResponse(url="/api-docs")
 
 
-@lru_cache(maxsize=None)
-def has_column(table_name: str, column_name: str) -> bool:
+# Schema probes never change while the process runs, so cache them per worker.
+# 表结构探测结果在进程运行期间不变，按 worker 缓存。
+_column_cache: dict[tuple[str, str], bool] = {}
+
+
+async def has_column(table_name: str, column_name: str) -> bool:
+    key = (table_name, column_name)
+    if key in _column_cache:
+        return _column_cache[key]
+
     sql = """
         select 1
         from information_schema.columns
@@ -94,13 +192,78 @@ def has_column(table_name: str, column_name: str) -> bool:
           and column_name = %(column_name)s
         limit 1;
     """
-    with get_conn() as conn:
-        with conn.cursor() as cur:
-            cur.execute(
+    async with get_pool().connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
                 sql,
                 {"table_name": table_name, "column_name": column_name},
             )
-            return cur.fetchone() is not None
+            _column_cache[key] = await cur.fetchone() is not None
+
+    return _column_cache[key]
+
+
+# to_char mask for every timestamp the API returns (ISO-8601, UTC, microseconds).
+# API 返回的所有时间戳统一使用的 to_char 格式（ISO-8601，UTC，微秒）。
+ISO_UTC_FMT = 'YYYY-MM-DD"T"HH24:MI:SS.US"Z"'
+
+
+# Query text with the schema-probe placeholders filled in, rendered once on first use
+# (not at startup, so the app comes up without the DB) so handlers only pick a variant.
+# 首次使用时一次性填好表结构探测占位符的 SQL（不在启动时渲染，数据库不可用也能启动）；
+# 处理函数只需选择变体，不再逐请求格式化。
+RENDERED_SQL: dict[str, str] = {}
+
+
+async def render_sql() -> None:
+    select_buy_in = (
+        "g.buy_in"
+        if await has_column("games", "buy_in")
+        else "0::numeric as buy_in"
+    )
+    select_avatar_url = (
+        "avatar_url"
+        if await has_column("players", "avatar_url")
+        else "null::text as avatar_url"
+    )
+    players_has_created_at = await has_column("players", "created_at")
+    select_created_at = (
+        f"""to_char(created_at at time zone 'UTC', '{ISO_UTC_FMT}') as created_at"""
+        if players_has_created_at
+        else "null::text as created_at"
+    )
+    # Sort on the real column (index-friendly), not the formatted text alias.
+    # 按真实列排序（可走索引），而不是格式化后的文本别名。
+    order_created_at = (
+        "players.created_at" if players_has_created_at else "created_at"
+    )
+    games_columns = {
+        "select_buy_in": select_buy_in,
+        "iso_utc_fmt": ISO_UTC_FMT,
+    }
+    players_columns = {
+        "select_avatar_url": select_avatar_url,
+        "select_created_at": select_created_at,
+        "order_created_at": order_created_at,
+    }
+
+    RENDERED_SQL.update(
+        list_games_all=LIST_GAMES_SQL_ALL.format(**games_columns),
+        list_games_filter=LIST_GAMES_SQL_FILTER.format(**games_columns),
+        get_game=GET_GAME_SQL.format(**games_columns),
+        list_players_all=LIST_PLAYERS_SQL_ALL.format(**players_columns),
+        list_players_filter=LIST_PLAYERS_SQL_FILTER.format(**players_columns),
+    )
+
+
+async def get_sql(name: str) -> str:
+    """
+    EN: Return a rendered query, rendering them all on the first call.
+    CN: 返回已渲染的 SQL；首次调用时先全部渲染。
+    """
+    if not RENDERED_SQL:
+        await render_sql()
+    return RENDERED_SQL[name]
 
 
 def serialize_buy_in(value):
@@ -123,8 +286,41 @@ def serialize_buy_in(value):
     return numeric
 
 
+# Fixed SQL per filter shape (no per-request concatenation), so the text is stable
+# and psycopg can keep one prepared statement per variant.
+# 每种筛选形态一条固定 SQL（不再逐请求拼接），便于 psycopg 复用预编译语句。
+LIST_GAMES_SQL_ALL = """
+    SELECT
+        g.game_id,
+        g.game_title,
+        to_char(g.start_time at time zone 'UTC', '{iso_utc_fmt}') AS start_time,
+        g.status,
+        {select_buy_in},
+        v.venue_name
+    FROM games g
+    JOIN venues v ON v.venue_id = g.venue_id
+    ORDER BY g.start_time DESC
+    LIMIT %(limit)s;
+"""
+
+LIST_GAMES_SQL_FILTER = """
+    SELECT
+        g.game_id,
+        g.game_title,
+        to_char(g.start_time at time zone 'UTC', '{iso_utc_fmt}') AS start_time,
+        g.status,
+        {select_buy_in},
+        v.venue_name
+    FROM games g
+    JOIN venues v ON v.venue_id = g.venue_id
+    WHERE v.venue_name ILIKE %(venue_like)s
+    ORDER BY g.start_time DESC
+    LIMIT %(limit)s;
+"""
+
+
 @app.get("/games")
-def list_games(
+async def list_games(
     limit: int = Query(20, ge=1, le=200),
     venue: str | None = Query(None),
 ):
@@ -132,137 +328,121 @@ def list_games(
     EN: Returns recent games. Optional filter: venue (case-insensitive, partial match)
     CN: 返回最近的比赛列表。可选筛选：venue（大小写不敏感，支持模糊匹配）
     """
-
-    select_buy_in = (
-        "g.buy_in"
-        if has_column("games", "buy_in")
-        else "0::numeric as buy_in"
-    )
-
-    base_sql = f"""
-        SELECT
-            g.game_id,
-            g.game_title,
-            g.start_time,
-            g.status,
-            {select_buy_in},
-            v.venue_name
-        FROM games g
-        JOIN venues v ON v.venue_id = g.venue_id
-    """
-
-    params = {}
-
-    # ✅ Only add WHERE when venue is provided
-    if venue:
-        base_sql += """
-        WHERE lower(v.venue_name) LIKE lower(%(venue_like)s)
-        """
-        params["venue_like"] = f"%{venue}%"
-
-    base_sql += """
-        ORDER BY g.start_time DESC
-        LIMIT %(limit)s;
-    """
-    params["limit"] = limit
-
-    with get_conn() as conn:
-        with conn.cursor() as cur:
-            cur.execute(base_sql, params)
-            rows = cur.fetchall()
-
-    out = []
-    for (game_id, game_title, start_time, status, buy_in, venue_name) in rows:
-        out.append(
-            {
-                "game_id": game_id,
-                "game_title": game_title,
-                "start_time": start_time.isoformat() if start_time else None,
-                "status": status,
-                "buy_in": serialize_buy_in(buy_in),
-                "venue_name": venue_name,
-            }
-        )
-
-    return out
+    cache_key = ("list_games", limit, venue)
+    cached = cache_get(cache_key)
+    if cached is not None:
+        return ORJSONResponse(cached)
+
+    # ✅ Only filter when venue is provided (the ALL variant ignores venue_like)
+    sql = await get_sql("list_games_filter" if venue else "list_games_all")
+    params = {"limit": limit, "venue_like": f"%{venue}%"}
+
+    async with get_pool().connection() as conn:
+        async with conn.cursor(row_factory=dict_row) as cur:
+            await cur.execute(sql, params)
+            rows = await cur.fetchall()
+
+    for row in rows:
+        row["buy_in"] = serialize_buy_in(row["buy_in"])
+
+    cache_set(cache_key, rows)
+    return ORJSONResponse(rows)
+
+
+# Game + venue + leaderboard in one round-trip; results come back as a JSON array.
+# 一次往返取回比赛、场地和榜单；results 以 JSON 数组返回。
+GET_GAME_SQL = """
+    select
+        g.game_id,
+        g.game_title,
+        to_char(g.start_time at time zone 'UTC', '{iso_utc_fmt}') as start_time,
+        g.status,
+        {select_buy_in},
+        v.venue_id,
+        v.venue_name,
+        coalesce(
+            (
+                select json_agg(
+                    json_build_object(
+                        'finish_rank', r.finish_rank,
+                        'player_id', r.player_id,
+                        'player', p.display_name,
+                        'points', r.points,
+                        'kos', r.kos,
+                        'eliminated_by', eb.display_name
+                    )
+                    order by r.finish_rank asc
+                )
+                from results r
+                join players p on p.player_id = r.player_id
+                left join players eb on eb.player_id = r.eliminated_by_player_id
+                where r.game_id = g.game_id
+            ),
+            '[]'::json
+        ) as results
+    from games g
+    join venues v on v.venue_id = g.venue_id
+    where g.game_id = %(game_id)s;
+"""
+
+GAME_RESULTS_SQL = """
+    select
+        r.finish_rank,
+        r.player_id,
+        p.display_name as player,
+        r.points,
+        r.kos,
+        eb.display_name as eliminated_by
+    from results r
+    join players p on p.player_id = r.player_id
+    left join players eb on eb.player_id = r.eliminated_by_player_id
+    where r.game_id = %(game_id)s
+    order by r.finish_rank asc;
+"""
 
 
 ## GET /games/{game_id}
 @app.get("/games/{game_id}")
-def get_game(game_id: int):
+async def get_game(game_id: int):
     """
     EN: Get a single game with venue + results.
     CN: 获取单场比赛详情（包含 venue + results 榜单）。
     """
+    # With Redis, read it first and keep no per-process copy: a per-worker cache
+    # would keep serving a leaderboard that another worker already invalidated.
+    # 使用 Redis 时优先读取 Redis，且不保留进程内副本：否则其他 worker 已失效的榜单仍会被返回。
+    cache_key = ("get_game", game_id)
+    if shared_enabled():
+        shared = await shared_get(game_key(game_id))
+        if shared is not None:
+            return ORJSONResponse(shared)
+    else:
+        pinned = get_pinned_game(game_id)
+        if pinned is not None:
+            return ORJSONResponse(pinned)
+
+        cached = cache_get(cache_key)
+        if cached is not None:
+            return ORJSONResponse(cached)
+
+    sql = await get_sql("get_game")
+
+    async with get_pool().connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(sql, {"game_id": game_id})
+            row = await cur.fetchone()
 
-    # 1) Query game + venue
-    select_buy_in = (
-        "g.buy_in"
-        if has_column("games", "buy_in")
-        else "0::numeric as buy_in"
-    )
+    if not row:
+        raise HTTPException(status_code=404, detail=f"Game {game_id} not found")
 
-    game_sql = f"""
-        select
-            g.game_id,
-            g.game_title,
-            g.start_time,
-            g.status,
-            {select_buy_in},
-            v.venue_id,
-            v.venue_name
-        from games g
-        join venues v on v.venue_id = g.venue_id
-        where g.game_id = %(game_id)s;
-    """
-
-    # 2) Query results (leaderboard)
-    results_sql = """
-        select
-            r.finish_rank,
-            r.player_id,
-            p.display_name as player,
-            r.points,
-            r.kos,
-            eb.display_name as eliminated_by
-        from results r
-        join players p on p.player_id = r.player_id
-        left join players eb on eb.player_id = r.eliminated_by_player_id
-        where r.game_id = %(game_id)s
-        order by r.finish_rank asc;
-    """
-
-    with get_conn() as conn:
-        with conn.cursor() as cur:
-            # game row
-            cur.execute(game_sql, {"game_id": game_id})
-            row = cur.fetchone()
-            if not row:
-                raise HTTPException(status_code=404, detail=f"Game {game_id} not found")
-
-            (gid, title, start_time, status, buy_in, venue_id, venue_name) = row
-
-            # results rows
-            cur.execute(results_sql, {"game_id": game_id})
-            results_rows = cur.fetchall()
-
-    results = []
-    for (finish_rank, player_id, player, points, kos, eliminated_by) in results_rows:
-        results.append(
-            {
-                "finish_rank": finish_rank,
-                "player_id": player_id,
-                "player": player,
-                "points": points,
-                "kos": kos,
-                "eliminated_by": eliminated_by,
-            }
-        )
+    # psycopg parses the json column, so results is already a list of dicts
+    # psycopg 会解析 json 列，results 已经是 dict 列表
+    (gid, title, start_time, status, buy_in, venue_id, venue_name, results) = row
 
-    return {
+    game = {
         "game_id": gid,
         "game_title": title,
-        "start_time": start_time.isoformat() if start_time else None,
+        "start_time": start_time,
         "status": status,
         "buy_in": serialize_buy_in(buy_in),
         "venue": {
@@ -272,99 +452,105 @@ def get_game(game_id: int):
         "results": results,
     }
 
+    if shared_enabled():
+        await shared_set(game_key(game_id), game)
+    else:
+        cache_set(cache_key, game)
+        pin_game(gid, game)
+    return ORJSONResponse(game)
+
 
 
 ## GET /games/{game_id}/results
 @app.get("/games/{game_id}/results")
-def game_results(game_id: int):
+async def game_results(game_id: int):
     """
     EN: Get results for a game (ordered by finish_rank)
     CN: 获取某场比赛的结果（按名次排序）
     """
-    sql = """
-        select
-            r.finish_rank,
-            r.player_id,
-            p.display_name as player,
-            r.points,
-            r.kos,
-            eb.display_name as eliminated_by
-        from results r
-        join players p on p.player_id = r.player_id
-        left join players eb on eb.player_id = r.eliminated_by_player_id
-        where r.game_id = %(game_id)s
-        order by r.finish_rank asc;
-    """
-
-    with get_conn() as conn:
-        with conn.cursor() as cur:
-            cur.execute(sql, {"game_id": game_id})
-            rows = cur.fetchall()
+    # Same lookup order as get_game: Redis only when configured, else the local cache.
+    # 与 get_game 相同：配置了 Redis 时只用 Redis，否则使用进程内缓存。
+    cache_key = ("game_results", game_id)
+    if shared_enabled():
+        shared = await shared_get(game_results_key(game_id))
+        if shared is not None:
+            return ORJSONResponse(shared)
+    else:
+        cached = cache_get(cache_key)
+        if cached is not None:
+            return ORJSONResponse(cached)
+
+    async with get_pool().connection() as conn:
+        async with conn.cursor(row_factory=dict_row) as cur:
+            await cur.execute(GAME_RESULTS_SQL, {"game_id": game_id})
+            rows = await cur.fetchall()
 
     # ✅ no results => return empty list (not 500)
-    out = []
-    for finish_rank, player_id, player, points, kos, eliminated_by in rows:
-        out.append(
-            {
-                "finish_rank": finish_rank,
-                "player_id": player_id,
-                "player": player,
-                "points": points,
-                "kos": kos,
-                "eliminated_by": eliminated_by,
-            }
-        )
-    return out
+    if shared_enabled():
+        await shared_set(game_results_key(game_id), rows)
+    else:
+        cache_set(cache_key, rows)
+    return ORJSONResponse(rows)
 
 
 ## Write API (create new games)
 @app.post("/games")
-def create_game(game: GameCreate):
+async def create_game(game: GameCreate):
     """
     EN: Create a new game using an existing venue_id.
     CN: 用已存在的 venue_id 创建一场比赛。
     """
-    # 1) check venue exists
-    sql_check_venue = "select venue_id, venue_name from venues where venue_id = %(venue_id)s;"
-    sql_insert_game = """
-        insert into games (game_title, start_time, venue_id, buy_in)
-        values (%(game_title)s, %(start_time)s, %(venue_id)s, %(buy_in)s)
-        returning game_id, game_title, start_time, status, buy_in, venue_id;
+    # Venue check + insert in one statement: no venue row => nothing inserted.
+    # 场地检查与插入合并为一条语句：场地不存在则不插入任何行。
+    sql_insert_game = f"""
+        with v as (
+            select venue_id, venue_name
+            from venues
+            where venue_id = %(venue_id)s
+        ),
+        ins as (
+            insert into games (game_title, start_time, venue_id, buy_in)
+            select %(game_title)s, %(start_time)s, v.venue_id, %(buy_in)s
+            from v
+            returning game_id, game_title, start_time, status, buy_in, venue_id
+        )
+        select ins.game_id, ins.game_title,
+               to_char(ins.start_time at time zone 'UTC', '{ISO_UTC_FMT}') as start_time,
+               ins.status, ins.buy_in, ins.venue_id, v.venue_name
+        from ins
+        join v on v.venue_id = ins.venue_id;
     """
 
     try:
-        with get_conn() as conn:
-            with conn.cursor() as cur:
-                # check venue
-                cur.execute(sql_check_venue, {"venue_id": game.venue_id})
-                v = cur.fetchone()
-                if not v:
-                    raise HTTPException(status_code=400, detail=f"venue_id {game.venue_id} does not exist")
-
-                venue_id, venue_name = v
-
-                # insert game
-                cur.execute(
+        async with get_pool().connection() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute(
                     sql_insert_game,
                     {
                         "game_title": game.game_title,
                         "start_time": game.start_time,
-                        "venue_id": venue_id,
+                        "venue_id": game.venue_id,
                         "buy_in": game.buy_in,
                     },
                 )
-                row = cur.fetchone()
+                row = await cur.fetchone()
+                if not row:
+                    raise HTTPException(status_code=400, detail=f"venue_id {game.venue_id} does not exist")
+
+        # Writes change listings and leaderboards; drop cached reads.
+        # 写操作会改变列表与榜单，清空读缓存。
+        invalidate()
     except HTTPException:
         raise
     except Exception as exc:
         raise HTTPException(status_code=500, detail=f"Create game failed: {exc}")
 
-    game_id, game_title, start_time, status, buy_in, venue_id = row
+    game_id, game_title, start_time, status, buy_in, venue_id, venue_name = row
 
     return {
         "game_id": game_id,
         "game_title": game_title,
-        "start_time": start_time.isoformat() if start_time else None,
+        "start_time": start_time,
         "status": status,
         "buy_in": serialize_buy_in(buy_in),
         "venue": {
@@ -373,50 +559,115 @@ def create_game(game: GameCreate):
         },
     }
 
+# add_results stages the batch with COPY (one round-trip) and upserts it in one
+# statement; a pipelined executemany is unnecessary on top of that.
+# add_results 先用 COPY 把整批结果写入临时表（一次往返），再用一条语句 upsert。
+ADD_RESULTS_STAGE_SQL = """
+    create temp table _stage_results (
+        seq int not null,
+        game_id bigint not null,
+        finish_rank int not null,
+        player_id bigint not null,
+        points int not null,
+        kos int not null,
+        eliminated_by_player_id bigint
+    ) on commit drop;
+"""
+
+ADD_RESULTS_COPY_SQL = """
+    copy _stage_results
+      (seq, game_id, finish_rank, player_id, points, kos, eliminated_by_player_id)
+    from stdin
+"""
+
+# distinct on keeps the last row per player, like the old row-by-row upsert did
+# distinct on 对同一玩家只保留最后一行，与原先逐行 upsert 的结果一致
+ADD_RESULTS_UPSERT_SQL = """
+    insert into results
+      (game_id, finish_rank, player_id, points, kos, eliminated_by_player_id)
+    select distinct on (player_id)
+      game_id, finish_rank, player_id, points, kos, eliminated_by_player_id
+    from _stage_results
+    order by player_id, seq desc
+    on conflict (game_id, player_id)
+    do update set
+      finish_rank = excluded.finish_rank,
+      points = excluded.points,
+      kos = excluded.kos,
+      eliminated_by_player_id = excluded.eliminated_by_player_id;
+"""
+
+
 ## Post Results
-@app.post("/games/{game_id}/results")
-def add_results(game_id: int, results: List[ResultCreate]):
+@app.post(
+    "/games/{game_id}/results",
+    # The body is read from the raw request, so describe it for /api-docs by hand.
+    # 请求体直接从原始请求读取，需要手动在 /api-docs 中描述。
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "application/json": {
+                    "schema": {
+                        "type": "array",
+                        "items": ResultCreate.model_json_schema(),
+                    }
+                }
+            },
+        }
+    },
+)
+async def add_results(game_id: int, request: Request):
     """
     EN: Add results for a game
     CN: 为指定比赛添加结果（批量）
     """
+    # Parse + validate the raw JSON bytes directly (no json.loads, no per-item pass).
+    # 直接解析并校验原始 JSON 字节（不经过 json.loads，也不逐项处理）。
+    try:
+        results = RESULTS_ADAPTER.validate_json(await request.body())
+    except ValidationError as exc:
+        raise RequestValidationError(
+            [
+                {**error, "loc": ("body", *error["loc"])}
+                for error in exc.errors(include_url=False)
+            ]
+        )
 
-    with get_conn() as conn:
-        with conn.cursor() as cur:
+    async with get_pool().connection() as conn:
+        # One transaction for the whole batch: a single commit (one WAL flush), and
+        # the key-share lock keeps the game from being deleted before we insert.
+        # 整批结果放在一个事务里：只提交一次（一次 WAL 刷盘），key share 锁防止比赛在插入前被删除。
+        async with conn.transaction(), conn.cursor() as cur:
 
             # 1. Check game exists
-            cur.execute(
-                "select 1 from games where game_id = %s",
+            await cur.execute(
+                "select 1 from games where game_id = %s for key share",
                 (game_id,),
             )
-            if cur.fetchone() is None:
+            if await cur.fetchone() is None:
                 return {"error": f"Game {game_id} not found"}
 
             # 2. Insert results
-            for r in results:
-               cur.execute(
-    """
-    insert into results
-      (game_id, finish_rank, player_id, points, kos, eliminated_by_player_id)
-    values
-      (%s, %s, %s, %s, %s, %s)
-    on conflict (game_id, player_id)
-    do update set
-      finish_rank = excluded.finish_rank,
-      points = excluded.points,
-      kos = excluded.kos,
-      eliminated_by_player_id = excluded.eliminated_by_player_id
-    """,
-    (
-        game_id,
-        r.finish_rank,
-        r.player_id,
-        r.points,
-        r.kos,
-        r.eliminated_by_player_id,
-    ),
-)
-
+            if results:
+                await cur.execute(ADD_RESULTS_STAGE_SQL)
+                async with cur.copy(ADD_RESULTS_COPY_SQL) as copy:
+                    for seq, r in enumerate(results):
+                        await copy.write_row(
+                            (
+                                seq,
+                                game_id,
+                                r.finish_rank,
+                                r.player_id,
+                                r.points,
+                                r.kos,
+                                r.eliminated_by_player_id,
+                            )
+                        )
+                await cur.execute(ADD_RESULTS_UPSERT_SQL)
+
+    invalidate()
+    await invalidate_game(game_id)
 
     return {
         "game_id": game_id,
@@ -424,9 +675,25 @@ def add_results(game_id: int, results: List[ResultCreate]):
     }
 
 
+LIST_PLAYERS_SQL_ALL = """
+    select player_id, display_name, {select_avatar_url}, {select_created_at}
+    from players
+    order by {order_created_at} desc
+    limit %(limit)s;
+"""
+
+LIST_PLAYERS_SQL_FILTER = """
+    select player_id, display_name, {select_avatar_url}, {select_created_at}
+    from players
+    where display_name ilike %(q)s
+    order by {order_created_at} desc
+    limit %(limit)s;
+"""
+
+
 ## Create players
 @app.get("/players")
-def list_players(
+async def list_players(
     limit: int = Query(50, ge=1, le=500),
     q: str | None = Query(None),
 ):
@@ -434,95 +701,81 @@ def list_players(
     EN: List players. Optional search by display_name (case-insensitive, partial).
     CN: 玩家列表。可选按 display_name 模糊搜索（大小写不敏感）。
     """
-    select_avatar_url = (
-        "avatar_url"
-        if has_column("players", "avatar_url")
-        else "null::text as avatar_url"
-    )
-    select_created_at = (
-        "created_at"
-        if has_column("players", "created_at")
-        else "null::timestamptz as created_at"
-    )
-
-    sql = f"""
-        select player_id, display_name, {select_avatar_url}, {select_created_at}
-        from players
-    """
-    params = {"limit": limit}
+    cache_key = ("list_players", limit, q)
+    cached = cache_get(cache_key)
+    if cached is not None:
+        return ORJSONResponse(cached)
 
-    if q:
-        sql += " where lower(display_name) like lower(%(q)s) "
-        params["q"] = f"%{q}%"
+    sql = await get_sql("list_players_filter" if q else "list_players_all")
+    params = {"limit": limit, "q": f"%{q}%"}
 
-    sql += " order by created_at desc limit %(limit)s; "
+    async with get_pool().connection() as conn:
+        async with conn.cursor(row_factory=dict_row) as cur:
+            await cur.execute(sql, params)
+            rows = await cur.fetchall()
 
-    with get_conn() as conn:
-        with conn.cursor() as cur:
-            cur.execute(sql, params)
-            rows = cur.fetchall()
-
-    out = []
-    for (player_id, display_name, avatar_url, created_at) in rows:
-        out.append(
-            {
-                "player_id": player_id,
-                "display_name": display_name,
-                "avatar_url": avatar_url,
-                "created_at": created_at.isoformat() if created_at else None,
-            }
-        )
-    return out
+    cache_set(cache_key, rows)
+    return ORJSONResponse(rows)
 
 
 @app.post("/players")
-def create_player(player: PlayerCreate):
+async def create_player(player: PlayerCreate):
     """
     EN: Create a player (case-insensitive unique by display_name).
     CN: 创建玩家（display_name 大小写不敏感唯一）。
     """
-    # 1) check duplicate (case-insensitive)
-    sql_check = """
-        select player_id, display_name, avatar_url, created_at
-        from players
-        where lower(display_name) = lower(%(name)s)
-        limit 1;
-    """
-    sql_insert = """
+    # The unique index on lower(display_name) rejects duplicates atomically;
+    # no row back means the name is taken.
+    # lower(display_name) 唯一索引原子地拦截重复；没有返回行即名字已存在。
+    sql_insert = f"""
         insert into players (display_name, avatar_url)
         values (%(name)s, %(avatar_url)s)
-        returning player_id, display_name, avatar_url, created_at;
+        on conflict ((lower(display_name))) do nothing
+        returning player_id, display_name, avatar_url,
+                  to_char(created_at at time zone 'UTC', '{ISO_UTC_FMT}') as created_at;
     """
 
-    with get_conn() as conn:
-        with conn.cursor() as cur:
-            cur.execute(sql_check, {"name": player.display_name})
-            existing = cur.fetchone()
-            if existing:
-                # 用 409 更符合 REST（你也可以改成直接返回 existing）
-                raise HTTPException(
-                    status_code=409,
-                    detail=f"player '{player.display_name}' already exists",
-                )
-
-            cur.execute(
+    async with get_pool().connection() as conn:
+        async with conn.cursor(row_factory=dict_row) as cur:
+            await cur.execute(
                 sql_insert,
                 {"name": player.display_name, "avatar_url": player.avatar_url},
             )
-            row = cur.fetchone()
+            row = await cur.fetchone()
 
-    (player_id, display_name, avatar_url, created_at) = row
-    return {
-        "player_id": player_id,
-        "display_name": display_name,
-        "avatar_url": avatar_url,
-        "created_at": created_at.isoformat() if created_at else None,
-    }
+    if not row:
+        # 用 409 更符合 REST
+        raise HTTPException(
+            status_code=409,
+            detail=f"player '{player.display_name}' already exists",
+        )
+
+    invalidate()
+
+    return row
+
+
+LIST_VENUES_SQL_ALL = f"""
+    select venue_id, venue_name, address, city, state,
+           to_char(created_at at time zone 'UTC', '{ISO_UTC_FMT}') as created_at
+    from venues
+    order by venues.created_at desc
+    limit %(limit)s;
+"""
+
+LIST_VENUES_SQL_FILTER = f"""
+    select venue_id, venue_name, address, city, state,
+           to_char(created_at at time zone 'UTC', '{ISO_UTC_FMT}') as created_at
+    from venues
+    where venue_name ilike %(q)s
+    order by venues.created_at desc
+    limit %(limit)s;
+"""
 
 
 ## Create venues
 @app.get("/venues")
-def list_venues(
+async def list_venues(
     limit: int = Query(50, ge=1, le=500),
     q: str | None = Query(None),
 ):
@@ -530,67 +783,40 @@ def list_venues(
     EN: List venues. Optional search by venue_name (case-insensitive, partial).
     CN: 场地列表。可选按 venue_name 模糊搜索（大小写不敏感）。
     """
-    sql = """
-        select venue_id, venue_name, address, city, state, created_at
-        from venues
-    """
-    params = {"limit": limit}
-
-    if q:
-        sql += " where lower(venue_name) like lower(%(q)s) "
-        params["q"] = f"%{q}%"
-
-    sql += " order by created_at desc limit %(limit)s; "
-
-    with get_conn() as conn:
-        with conn.cursor() as cur:
-            cur.execute(sql, params)
-            rows = cur.fetchall()
-
-    out = []
-    for (venue_id, venue_name, address, city, state, created_at) in rows:
-        out.append(
-            {
-                "venue_id": venue_id,
-                "venue_name": venue_name,
-                "address": address,
-                "city": city,
-                "state": state,
-                "created_at": created_at.isoformat() if created_at else None,
-            }
-        )
-    return out
+    cache_key = ("list_venues", limit, q)
+    cached = cache_get(cache_key)
+    if cached is not None:
+        return ORJSONResponse(cached)
+
+    sql = LIST_VENUES_SQL_FILTER if q else LIST_VENUES_SQL_ALL
+    params = {"limit": limit, "q": f"%{q}%"}
+
+    async with get_pool().connection() as conn:
+        async with conn.cursor(row_factory=dict_row) as cur:
+            await cur.execute(sql, params)
+            rows = await cur.fetchall()
+
+    cache_set(cache_key, rows)
+    return ORJSONResponse(rows)
 
 
 @app.post("/venues")
-def create_venue(venue: VenueCreate):
+async def create_venue(venue: VenueCreate):
     """
     EN: Create a venue (case-insensitive unique by venue_name).
     CN: 创建场地（venue_name 大小写不敏感唯一）。
     """
-    sql_check = """
-        select venue_id, venue_name, address, city, state, created_at
-        from venues
-        where lower(venue_name) = lower(%(name)s)
-        limit 1;
-    """
-    sql_insert = """
+    sql_insert = f"""
         insert into venues (venue_name, address, city, state)
         values (%(name)s, %(address)s, %(city)s, %(state)s)
-        returning venue_id, venue_name, address, city, state, created_at;
+        on conflict ((lower(venue_name))) do nothing
+        returning venue_id, venue_name, address, city, state,
+                  to_char(created_at at time zone 'UTC', '{ISO_UTC_FMT}') as created_at;
     """
 
-    with get_conn() as conn:
-        with conn.cursor() as cur:
-            cur.execute(sql_check, {"name": venue.venue_name})
-            existing = cur.fetchone()
-            if existing:
-                raise HTTPException(
-                    status_code=409,
-                    detail=f"venue '{venue.venue_name}' already exists",
-                )
-
-            cur.execute(
+    async with get_pool().connection() as conn:
+        async with conn.cursor(row_factory=dict_row) as cur:
+            await cur.execute(
                 sql_insert,
                 {
                     "name": venue.venue_name,
@@ -599,21 +825,21 @@ def create_venue(venue: VenueCreate):
                     "state": venue.state,
                 },
             )
-            row = cur.fetchone()
+            row = await cur.fetchone()
 
-    (venue_id, venue_name, address, city, state, created_at) = row
-    return {
-        "venue_id": venue_id,
-        "venue_name": venue_name,
-        "address": address,
-        "city": city,
-        "state": state,
-        "created_at": created_at.isoformat() if created_at else None,
-    }
+    if not row:
+        raise HTTPException(
+            status_code=409,
+            detail=f"venue '{venue.venue_name}' already exists",
+        )
+
+    invalidate()
+
+    return row
 
 
 @app.delete("/games/{game_id}/results/{player_id}")
-def delete_result(game_id: int, player_id: int):
+async def delete_result(game_id: int, player_id: int):
     """
     EN: Delete a single player's result for a game.
     CN: 删除某场比赛中某位玩家的一条结果。
@@ -624,10 +850,13 @@ def delete_result(game_id: int, player_id: int):
         returning result_id;
     """
 
-    with get_conn() as conn:
-        with conn.cursor() as cur:
-            cur.execute(sql, {"game_id": game_id, "player_id": player_id})
-            row = cur.fetchone()
+    async with get_pool().connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(sql, {"game_id": game_id, "player_id": player_id})
+            row = await cur.fetchone()
+
+    invalidate()
+    await invalidate_game(game_id)
 
     if not row:
         raise HTTPException(status_code=404, detail="Result not found")
@@ -640,7 +869,7 @@ def delete_result(game_id: int, player_id: int):
 
 
 @app.delete("/games/{game_id}")
-def delete_game(game_id: int):
+async def delete_game(game_id: int):
     """
     EN: Delete a game and cascade-delete its results.
     CN: 删除一场比赛，并级联删除相关结果。
@@ -652,13 +881,19 @@ def delete_game(game_id: int):
         returning game_id, game_title;
     """
 
-    with get_conn() as conn:
-        with conn.cursor() as cur:
-            cur.execute(sql_count, {"game_id": game_id})
-            deleted_results = cur.fetchone()[0]
+    async with get_pool().connection() as conn:
+        async with conn.cursor() as count_cur, conn.cursor() as delete_cur:
+            # Pipeline: both statements go out in one flight, results are read after.
+            # 管道模式：两条语句一次发出，之后再读取结果。
+            async with conn.pipeline():
+                await count_cur.execute(sql_count, {"game_id": game_id})
+                await delete_cur.execute(sql_delete, {"game_id": game_id})
 
-            cur.execute(sql_delete, {"game_id": game_id})
-            row = cur.fetchone()
+            deleted_results = (await count_cur.fetchone())[0]
+            row = await delete_cur.fetchone()
+
+    invalidate()
+    await invalidate_game(game_id)
 
     if not row:
         raise HTTPException(status_code=404, detail=f"Game {game_id} not found")
@@ -673,7 +908,7 @@ def delete_game(game_id: int):
 
 
 @app.delete("/players/{player_id}")
-def delete_player(player_id: int):
+async def delete_player(player_id: int):
     """
     EN: Delete a player when no game results depend on them.
     CN: 当没有比赛结果依赖该玩家时删除玩家。
@@ -695,23 +930,29 @@ def delete_player(player_id: int):
         returning player_id, display_name;
     """
 
-    with get_conn() as conn:
-        with conn.cursor() as cur:
-            cur.execute(sql_player, {"player_id": player_id})
-            player = cur.fetchone()
+    async with get_pool().connection() as conn:
+        async with conn.cursor() as cur, conn.cursor() as usage_cur:
+            # Pipeline the two independent lookups into one round-trip.
+            # 两个互不依赖的查询用管道模式合并为一次往返。
+            async with conn.pipeline():
+                await cur.execute(sql_player, {"player_id": player_id})
+                await usage_cur.execute(sql_usage, {"player_id": player_id})
+
+            player = await cur.fetchone()
             if not player:
                 raise HTTPException(status_code=404, detail=f"Player {player_id} not found")
 
-            cur.execute(sql_usage, {"player_id": player_id})
-            linked_results = cur.fetchone()[0]
+            linked_results = (await usage_cur.fetchone())[0]
             if linked_results > 0:
                 raise HTTPException(
                     status_code=409,
                     detail="Cannot delete player with recorded game results. Delete those results first.",
                 )
 
-            cur.execute(sql_delete, {"player_id": player_id})
-            row = cur.fetchone()
+            await cur.execute(sql_delete, {"player_id": player_id})
+            row = await cur.fetchone()
+
+    invalidate()
 
     deleted_player_id, display_name = row
     return {
@@ -722,7 +963,7 @@ def delete_player(player_id: int):
 
 
 @app.delete("/venues/{venue_id}")
-def delete_venue(venue_id: int):
+async def delete_venue(venue_id: int):
     """
     EN: Delete a venue when no games are linked to it.
     CN: 当没有比赛关联该场地时删除场地。
@@ -743,23 +984,29 @@ def delete_venue(venue_id: int):
         returning venue_id, venue_name;
     """
 
-    with get_conn() as conn:
-        with conn.cursor() as cur:
-            cur.execute(sql_venue, {"venue_id": venue_id})
-            venue = cur.fetchone()
+    async with get_pool().connection() as conn:
+        async with conn.cursor() as cur, conn.cursor() as usage_cur:
+            # Pipeline the two independent lookups into one round-trip.
+            # 两个互不依赖的查询用管道模式合并为一次往返。
+            async with conn.pipeline():
+                await cur.execute(sql_venue, {"venue_id": venue_id})
+                await usage_cur.execute(sql_usage, {"venue_id": venue_id})
+
+            venue = await cur.fetchone()
             if not venue:
                 raise HTTPException(status_code=404, detail=f"Venue {venue_id} not found")
 
-            cur.execute(sql_usage, {"venue_id": venue_id})
-            linked_games = cur.fetchone()[0]
+            linked_games = (await usage_cur.fetchone())[0]
             if linked_games > 0:
                 raise HTTPException(
                     status_code=409,
                     detail="Cannot delete venue with existing games. Delete those games first.",
                 )
 
-            cur.execute(sql_delete, {"venue_id": venue_id})
-            row = cur.fetchone()
+            await cur.execute(sql_delete, {"venue_id": venue_id})
+            row = await cur.fetchone()
+
+    invalidate()
 
     deleted_venue_id, venue_name = row
     return {